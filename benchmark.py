@@ -0,0 +1,361 @@
+# benchmark.py: Parallel benchmark runner for bimaru.py.
+#
+# Every instance runs in its own python process (with a time and a memory limit),
+# and the instances are spread over a pool of workers. The results (wall time,
+# CPU time, peak RSS, nodes expanded and whether the output is a solution) are
+# written to a CSV or JSON file.
+#
+#   $ python3 benchmark.py --dirs easy hard --jobs 4 --output results.csv --solver sat
+#
+# Options not listed in --help are passed to bimaru.py (see bimaru.parse_arguments).
+
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter, process_time
+
+DIRECTORIES = ('easy', 'medium', 'hard', 'impossible', 'provided')
+FIELDS = ('directory', 'instance', 'status', 'passed', 'wall', 'total', 'cpu', 'rss_kb', 'nodes')
+
+
+def child(argv: list):
+    """Solves the instance in the standard input, printing a line with the statistics
+    (as JSON) followed by the solution. Runs in the process started for each instance."""
+    import bimaru
+    from search import InstrumentedProblem
+
+    args = bimaru.parse_arguments(argv)
+    problems = []
+
+    def wrap(problem):
+        problems.append(InstrumentedProblem(problem))
+        return problems[-1]
+
+    start, clock = perf_counter(), process_time()
+
+    try:
+        solved = bimaru.solve(bimaru.Board.parse_instance(args.boats), args, wrap)
+    except MemoryError:
+        print(json.dumps({'status': 'memory'}))
+        return
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    print(json.dumps({
+        'wall': perf_counter() - start,
+        'cpu': process_time() - clock,
+        'rss_kb': usage.ru_maxrss,
+        'nodes': problems[0].succs if problems else None,
+    }))
+
+    if solved is not None:
+        solved.print()
+
+
+def check(path: str, lines: list, boats: list):
+    """Returns None if the given output lines are a solution of the instance in path,
+    or a string with the reason why they are not."""
+    expected = path[:-len('.txt')] + '.out'
+
+    if os.path.exists(expected):
+        with open(expected) as file:
+            if (file.read().split() == lines):
+                return None
+
+    with open(path) as file:
+        rows = [int(i) for i in file.readline().split()[1:]]
+        cols = [int(i) for i in file.readline().split()[1:]]
+        hints = [file.readline().split()[1:] for _ in range(int(file.readline()))]
+
+    n = len(rows)
+
+    if (len(lines) != n) or any(len(line) != n for line in lines):
+        return 'malformed output'
+
+    ship = {(r, c) for r in range(n) for c in range(n) if lines[r][c] not in '.W'}
+
+    if [sum((r, c) in ship for c in range(n)) for r in range(n)] != rows:
+        return 'wrong row values'
+
+    if [sum((r, c) in ship for r in range(n)) for c in range(n)] != cols:
+        return 'wrong column values'
+
+    for r, c, hint in hints:
+        if (lines[int(r)][int(c)].upper() != hint):
+            return 'hint %s at (%s, %s) not kept' % (hint, r, c)
+
+    sizes = Counter()
+
+    for r, c in ship:
+        if (r, c - 1) in ship or (r - 1, c) in ship:
+            continue
+
+        # (r, c) is the top left cell of a boat.
+        vertical = (r + 1, c) in ship
+        size = 1
+
+        while (r + vertical * size, c + (not vertical) * size) in ship:
+            size += 1
+
+        cells = [(r + vertical * i, c + (not vertical) * i) for i in range(size)]
+        ends = 'tb' if vertical else 'lr'
+        pieces = 'c' if (size == 1) else ends[0] + 'm' * (size - 2) + ends[1]
+
+        if ''.join(lines[a][b].lower() for a, b in cells) != pieces:
+            return 'wrong pieces in the boat at (%d, %d)' % (r, c)
+
+        for a, b in cells:
+            if any((a + da, b + db) in ship for da in (-1, 1) for db in (-1, 0, 1)
+                   if (a + da, b + db) not in cells) or \
+               any((a, b + db) in ship for db in (-1, 1) if (a, b + db) not in cells):
+                return 'the boat at (%d, %d) touches another boat' % (r, c)
+
+        sizes[size] += 1
+
+    if any(sizes[len(boats) - i] != count for i, count in enumerate(boats)) or \
+       any(size > len(boats) for size in sizes):
+        return 'wrong fleet'
+
+    return None
+
+
+def instance_paths(directory: str):
+    """Returns the paths of the instances in the given directory of instances/."""
+    base = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instances', directory)
+    return [os.path.join(base, name) for name in sorted(os.listdir(base)) if name.endswith('.txt')]
+
+
+def limit_memory(megabytes: int):
+    """Returns a function that limits the address space of a new process."""
+    def limit():
+        size = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+    return limit
+
+
+def run(task: tuple):
+    """Runs one instance in a new process. Returns the row of results."""
+    path, options, timeout, memory, boats = task
+    row = dict.fromkeys(FIELDS)
+    row['directory'] = os.path.basename(os.path.dirname(path))
+    row['instance'] = os.path.basename(path)
+    start = perf_counter()
+
+    try:
+        with open(path, 'rb') as file:
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'] + options,
+                                    stdin=file, capture_output=True, timeout=timeout,
+                                    preexec_fn=limit_memory(memory) if memory else None)
+    except subprocess.TimeoutExpired:
+        row.update(status='timeout', passed=False, total=perf_counter() - start)
+        return row
+
+    row['total'] = perf_counter() - start
+    stats, _, solution = result.stdout.decode().partition('\n')
+
+    if (result.returncode != 0) or not stats:
+        memory_error = b'MemoryError' in result.stderr
+        row.update(status='memory' if memory_error else 'error', passed=False)
+        return row
+
+    row.update(json.loads(stats))
+
+    if (row['status'] is None):
+        reason = check(path, solution.split(), boats)
+        row.update(status=reason or 'ok', passed=reason is None)
+    else:
+        row['passed'] = False
+
+    return row
+
+
+def write(rows: list, output: str):
+    """Writes the results to a JSON file (if output ends with .json) or a CSV file."""
+    with open(output, 'w', newline='') as file:
+        if output.endswith('.json'):
+            json.dump(rows, file, indent=1)
+        else:
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def import_time(module: str, runs: int):
+    """Returns the smallest time (in seconds) taken by a new python process to import
+    the given module, over the given number of runs."""
+    code = 'from time import perf_counter as t; s = t(); import %s; print(t() - s)' % module
+    times = []
+
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(float(result.stdout))
+
+    return min(times)
+
+
+def graph_search_times(nodes: int, seed: int = 0):
+    """Returns the time (in seconds) taken by depth_first_graph_search and by
+    breadth_first_graph_search to explore all of a RandomGraph with the given
+    number of nodes (the goal is not in the graph)."""
+    import random
+    from search import breadth_first_graph_search, depth_first_graph_search
+    from search_extras import GraphProblem, RandomGraph
+
+    random.seed(seed)
+    graph = RandomGraph(list(range(nodes)), min_links=8)
+    times = {}
+
+    for search in (depth_first_graph_search, breadth_first_graph_search):
+        start = perf_counter()
+        search(GraphProblem(0, None, graph))
+        times[search.__name__] = perf_counter() - start
+
+    return times
+
+
+def search_memory(paths: list, compact: bool):
+    """Returns the largest peak of memory (in bytes, traced by tracemalloc) and the
+    total time of breadth_first_graph_search and of astar_search over the given
+    instances, keeping the search tree in Nodes or (if compact) in a NodeStore."""
+    import tracemalloc
+    import bimaru
+    from search import astar_search, breadth_first_graph_search
+
+    results = {}
+
+    for search in (breadth_first_graph_search, astar_search):
+        peak = total = 0
+
+        for path in paths:
+            with open(path) as file:
+                board = bimaru.Board.parse_instance(stream=file)
+
+            tracemalloc.start()
+            start = perf_counter()
+            search(bimaru.Bimaru(board), compact=compact)
+            total += perf_counter() - start
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        results[search.__name__] = (peak, total)
+
+    return results
+
+
+def heuristic_results(paths: list):
+    """Returns the nodes expanded and the total time (in seconds) of the greedy, A*
+    and IDA* searches with each heuristic of heuristics.py over the given instances,
+    and the number of instances each one solved."""
+    import bimaru
+    from heuristics import HEURISTICS
+    from search import InstrumentedProblem, astar_search, greedy_search, iterative_deepening_astar_search
+
+    boards = []
+
+    for path in paths:
+        with open(path) as file:
+            boards.append(bimaru.Board.parse_instance(stream=file))
+
+    results = {}
+
+    for name, heuristic in HEURISTICS.items():
+        for search in (greedy_search, astar_search, iterative_deepening_astar_search):
+            nodes = solved = 0
+            start = perf_counter()
+
+            for board in boards:
+                problem = InstrumentedProblem(bimaru.Bimaru(board.__clone__(), heuristic=heuristic))
+                solved += search(problem) is not None
+                nodes += problem.succs
+
+            results[name, search.__name__] = (nodes, perf_counter() - start, solved)
+
+    return results
+
+
+def main():
+    parser = ArgumentParser(description='Runs bimaru.py over the instance directories in parallel.',
+                            epilog='Any other option is passed to bimaru.py.')
+    parser.add_argument('--dirs', nargs='+', default=DIRECTORIES,
+                        help='directories of instances/ to run (default: all)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='number of instances run at the same time (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='time limit of each instance, in seconds (default: %(default)s)')
+    parser.add_argument('--memory', type=int, default=2048,
+                        help='memory limit of each instance, in MB, or 0 for none (default: %(default)s)')
+    parser.add_argument('--output', default='results.csv',
+                        help='results file, CSV or JSON (.json) (default: %(default)s)')
+    parser.add_argument('--imports', type=int, metavar='RUNS',
+                        help='only measure the cold start import time of the solver modules')
+    parser.add_argument('--graph', type=int, metavar='NODES',
+                        help='only measure the graph searches on a RandomGraph with this many nodes')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='only measure the peak memory of the breadth first and A* searches')
+    parser.add_argument('--heuristics', action='store_true',
+                        help='only compare the heuristics of heuristics.py on the greedy, A* and IDA* searches')
+    args, options = parser.parse_known_args()
+
+    if args.heuristics:
+        paths = [path for directory in args.dirs for path in instance_paths(directory)]
+
+        for (heuristic, search), (nodes, time, solved) in heuristic_results(paths).items():
+            print('%s, %s: %d nodes, %.2fs, %d/%d solved' % (heuristic, search, nodes, time, solved, len(paths)))
+
+        return
+
+    if args.tracemalloc:
+        paths = [path for directory in args.dirs for path in instance_paths(directory)]
+
+        for compact in (False, True):
+            for search, (peak, total) in search_memory(paths, compact).items():
+                print('%s%s: peak %.1fKB, %.2fs' % (search, ' (compact)' if compact else '', peak / 1024, total))
+
+        return
+
+    if args.graph:
+        for search, time in graph_search_times(args.graph).items():
+            print('%s: %.3fs' % (search, time))
+
+        return
+
+    if args.imports:
+        for module in ('search', 'search_extras', 'bimaru'):
+            print('import %s: %.1fms' % (module, import_time(module, args.imports) * 1000))
+
+        return
+
+    import bimaru
+    boats = bimaru.parse_arguments(options).boats
+    paths = [path for directory in args.dirs for path in instance_paths(directory)]
+    tasks = [(path, options, args.timeout, args.memory, boats) for path in paths]
+    rows = []
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for row in executor.map(run, tasks):
+            rows.append(row)
+
+            if not row['passed']:
+                print('%s/%s: %s' % (row['directory'], row['instance'], row['status']))
+
+    write(rows, args.output)
+
+    for directory in args.dirs:
+        results = [row for row in rows if (row['directory'] == directory)]
+        passed = sum(row['passed'] for row in results)
+        cpu = sum(row['cpu'] or 0 for row in results)
+        print('%s: %d/%d passed, %.2fs of CPU time' % (directory, passed, len(results), cpu))
+
+
+if __name__ == "__main__":
+    if (sys.argv[1:2] == ['--child']):
+        child(sys.argv[2:])
+    else:
+        main()
@@ -6,25 +6,58 @@
 # 103403 Guilherme Henriques
 # 104126 Fábio Neto
 
-from sys import stdin
+import json
+import os
+from argparse import ArgumentParser, Namespace
+from functools import lru_cache, partial
+from io import StringIO
+from itertools import islice
+from random import Random
+from sys import stderr, stdin
+import heuristics
 from search import (
     Problem,
     Node,
+    ProfiledProblem,
     astar_search,
+    backtracking_search,
+    breadth_first_graph_search,
     breadth_first_tree_search,
+    depth_first_graph_search,
+    depth_first_solutions,
+    depth_first_transposition_search,
     depth_first_tree_search,
     greedy_search,
+    iterative_deepening_astar_search,
+    recursive_backtracking_search,
 )
 
-# Board settings
-BOARD_SIZE = 10      # number of columns/rows
+# Default board settings
 BOATS = [1, 2, 3, 4] # boats to add in inverse order (big to small).
 
-# How much a hint, a cell and a boat count as an heuristic
+# How much a hint, a cell and a boat count as an heuristic. A profile written by
+# tune.py overrides them when it exists (see load_profile).
 hhint = 1
 hcell = 0
 hboat = 1
 
+# Profile with tuned weights (written by tune.py, not tracked), loaded when this module is imported
+PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profile.json')
+
+def load_profile(path: str = PROFILE):
+    """Sets hhint, hcell and hboat to the weights of the given profile, if it exists."""
+    global hhint, hcell, hboat
+
+    if not os.path.exists(path):
+        return
+
+    with open(path) as file:
+        profile = json.load(file)
+
+    hhint, hcell, hboat = profile['hhint'], profile['hcell'], profile['hboat']
+
+load_profile()
+
 # Non-pieces
 EMPTY, WATER = (None, 'w')
 
@@ -34,126 +67,323 @@ CIRCLE, MID = ('c', 'm')
 # Directional Pieces
 LEFT, RIGHT, TOP, BOT = ('l', 'r', 't', 'b')
 
-def new_grid():
-    """Creates a new grid of size BOARD_SIZE."""
-    return [[EMPTY for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+PIECES = (CIRCLE, MID, LEFT, RIGHT, TOP, BOT)
+
+# Offset (row, column) of the ship cell that a directional hint forces next to it
+HINT_NEIGHBOURS = {'L': (0, 1), 'R': (0, -1), 'T': (1, 0), 'B': (-1, 0)}
+
+class Geometry:
+    """Masks and tables that only depend on the size of the board.
+
+    A board of size N is stored row by row, one bit per cell, in a single integer.
+    There is a single Geometry for each size (see get_geometry), shared by all its boards.
+    It includes the table of every placement of each boat size, built the first time
+    it is needed."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.row_masks = tuple(((1 << size) - 1) << (r * size) for r in range(size))
+        self.col_masks = tuple(sum(self.bit(r, c) for r in range(size)) for c in range(size))
+        self.full_mask = (1 << (size * size)) - 1
+
+        # Zobrist keys of a ship cell and of a water cell
+        random = Random(size)
+        self.zobrist_ship = tuple(random.getrandbits(64) for _ in range(size * size))
+        self.zobrist_water = tuple(random.getrandbits(64) for _ in range(size * size))
+        self.boat_keys = {}
+
+        # Boat size -> placements, and action -> (cells, ring, pieces)
+        self.tables = {}
+        self.masks = {}
+
+    def __reduce__(self):
+        """Boards sent to another process (see parallel.py) use the Geometry of that process."""
+        return (get_geometry, (self.size,))
+
+    def bit(self, r: int, c: int):
+        """Returns the bitmask of the cell (r, c)."""
+        return 1 << (r * self.size + c)
+
+    def bits(self, mask: int):
+        """Yields the (row, column) of every cell set in the given mask, in row-major order."""
+        while mask:
+            low = mask & -mask
+            yield divmod(low.bit_length() - 1, self.size)
+            mask ^= low
+
+    def shift(self, mask: int, dr: int, dc: int):
+        """Moves every cell of the mask by dr rows and dc columns (-1, 0 or 1).
+        Cells that would leave the board are dropped."""
+        if (dc > 0):
+            mask &= ~self.col_masks[-1]
+        elif (dc < 0):
+            mask &= ~self.col_masks[0]
+
+        offset = dr * self.size + dc
+        return ((mask << offset) if (offset > 0) else (mask >> -offset)) & self.full_mask
+
+    def diagonals(self, mask: int):
+        """Returns the cells diagonally adjacent to the cells of the mask."""
+        return self.shift(mask, -1, -1) | self.shift(mask, -1, 1) | self.shift(mask, 1, -1) | self.shift(mask, 1, 1)
+
+    def zobrist(self, ship: int, water: int):
+        """Returns the XOR of the Zobrist keys of the given ship and water cells."""
+        key = 0
+
+        for mask, keys in ((ship, self.zobrist_ship), (water, self.zobrist_water)):
+            while mask:
+                low = mask & -mask
+                key ^= keys[low.bit_length() - 1]
+                mask ^= low
+
+        return key
+
+    def boat_key(self, size: int, count: int):
+        """Returns the Zobrist key of having count boats of the given size left."""
+        if (size, count) not in self.boat_keys:
+            self.boat_keys[size, count] = Random(self.size * (size * 1000 + count)).getrandbits(64)
+
+        return self.boat_keys[size, count]
+
+    def placement_index(self, r: int, c: int, size: int, vertical = False):
+        """Returns the position of the given boat in a fixed order of all placements of its size."""
+        return (r * self.size + c) * 2 + vertical
+
+    def placements(self, size: int):
+        """Returns the table of every placement of a boat of the given size.
+
+        Each placement is a tuple (action, cells, ring, pieces), where action is the one
+        generated by Board.generate_actions, cells are the cells occupied by the boat,
+        ring are the surrounding cells (that must be water) and pieces is a tuple of
+        (piece, mask). Placements follow the order in which actions are generated."""
+        if size not in self.tables:
+            if (size == 1):
+                actions = [(r, c, size) for r in range(self.size) for c in range(self.size)]
+            else:
+                actions = []
+
+                for i in range(self.size):
+                    for j in range(self.size + 1 - size):
+                        actions.append((j, i, size, True))
+                        actions.append((i, j, size, False))
+
+            self.tables[size] = [(action,) + self.boat_masks(action) for action in actions]
+
+        return self.tables[size]
+
+    def boat_masks(self, action: tuple):
+        """Returns the masks (cells, ring, pieces) of the boat inserted by the given action."""
+        if action not in self.masks:
+            r, c, size = action[:3]
+            vertical = (size > 1) and action[3]
+            first = self.bit(r, c)
+
+            if (size == 1):
+                cells = first
+                pieces = ((CIRCLE, cells),)
+            else:
+                step = self.size if vertical else 1
+                last = first << (step * (size - 1))
+                cells = sum(first << (step * i) for i in range(size))
+                ends = ((TOP, first), (BOT, last)) if vertical else ((LEFT, first), (RIGHT, last))
+                pieces = ends + (((MID, cells & ~(first | last)),) if (size > 2) else ())
+
+            around = cells | self.shift(cells, 0, -1) | self.shift(cells, 0, 1)
+            around |= self.shift(around, -1, 0) | self.shift(around, 1, 0)
+            self.masks[action] = (cells, around & ~cells, pieces)
+
+        return self.masks[action]
+
+@lru_cache(maxsize=None)
+def get_geometry(size: int):
+    """Returns the Geometry shared by all boards of the given size."""
+    return Geometry(size)
 
 class Board:
-    """Representação interna de um tabuleiro de Bimaru."""
+    """Representação interna de um tabuleiro de Bimaru.
+
+    Boards can have any size (given by the number of row values) and any fleet: boats[-size]
+    is the number of boats of each size left to insert. The grid is kept as bitboards: one
+    integer for the ship cells, one for the water cells and one for each piece type (see
+    PIECES). Hints are kept as a dictionary from the hint letter to the mask of the cells
+    where it was given.
+
+    Cells that are known to be part of a boat that was not inserted yet are kept in forced.
+    They are still empty, and are still counted in row_values and col_values.
+
+    The goal test is done in constant time by keeping two counters up to date: unsatisfied
+    (hints whose cell does not have the hinted value yet) and remaining (the sum of all row
+    and column values).
+
+    Boards are equal if they have the same cells and boats left, and are hashed by key, a
+    Zobrist hash of the ship cells, the water cells and the boats that is kept up to date
+    as the board changes.
+
+    When the search breaks the symmetry between boats of the same size, last keeps the
+    (size, placement_index) of the last boat it inserted, and generate_actions only returns
+    boats of that size that come after it. Otherwise last is None."""
 
-    def __init__(self, row_values, col_values, h, hints = new_grid(), grid = new_grid(), boats = BOATS):
+    __slots__ = ('geometry', 'row_values', 'col_values', 'h', 'hints', 'ship', 'water', 'pieces', 'boats',
+                 'forced', 'unsatisfied', 'remaining', 'key', 'last', 'consistent', 'trail', 'frames')
+
+    def __init__(self, row_values, col_values, h, hints = None, ship = 0, water = 0, pieces = None, boats = None,
+                 forced = 0, unsatisfied = 0, remaining = None, key = None, last = None, geometry = None):
+        self.geometry = get_geometry(len(row_values)) if geometry is None else geometry
         self.row_values = row_values
         self.col_values = col_values
         self.h = h
-        self.hints = hints
-        self.grid = grid
-        self.boats = boats
+        self.hints = {} if hints is None else hints
+        self.ship = ship
+        self.water = water
+        self.pieces = dict.fromkeys(PIECES, 0) if pieces is None else pieces
+        self.boats = BOATS.copy() if boats is None else boats
+        self.forced = forced
+        self.unsatisfied = unsatisfied
+        self.remaining = (sum(row_values) + sum(col_values)) if remaining is None else remaining
+        self.key = self.compute_key() if key is None else key
+        self.last = last
+        self.consistent = True
+        self.trail = self.frames = None  # Created by the first apply
 
     def __clone__(self):
         """Creates a complete clone from this board.
         Hints are not copied as they can be shared among boards."""
         row_values = self.row_values.copy()
         col_values = self.col_values.copy()
-        grid = [self.grid[r].copy() for r in range(BOARD_SIZE)]
+        pieces = self.pieces.copy()
         boats = self.boats.copy()
 
-        return Board(row_values, col_values, self.h, self.hints, grid, boats)
+        return Board(row_values, col_values, self.h, self.hints, self.ship, self.water, pieces, boats,
+                     self.forced, self.unsatisfied, self.remaining, self.key, self.last, self.geometry)
+
+    def compute_key(self):
+        """Computes the Zobrist hash of this board from scratch."""
+        key = self.geometry.zobrist(self.ship, self.water)
+
+        for size in range(1, len(self.boats) + 1):
+            key ^= self.geometry.boat_key(size, self.boats[-size])
+
+        return key
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and ((self.ship, self.water, self.boats, self.last) ==
+                                             (other.ship, other.water, other.boats, other.last))
+
+    def __hash__(self):
+        return self.key
     
     def is_goal(self):
         """Returns True if this board reached a successful (goal) state"""
-        if sum(self.row_values) or sum(self.boats):
-            return False
+        return self.consistent and not (self.remaining or self.unsatisfied or any(self.boats))
 
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                hint = self.hints[r][c]
+    def is_pos_valid(self, r: int, c: int):
+        """Returns True if the given position is valid for this board."""
+        return (0 <= r < self.geometry.size) and (0 <= c < self.geometry.size)
 
-                if (hint is not EMPTY) and (self.grid[r][c] != hint.lower()):
-                    return False
+    def get_hint(self, r: int, c: int):
+        """Returns the hint given in the given position, or EMPTY if there is none."""
+        b = self.geometry.bit(r, c)
 
-        return True
+        for hint, mask in self.hints.items():
+            if (mask & b):
+                return hint
 
-    def is_pos_valid(self, r: int, c: int):
-        """Returns True if the given position is valid for this board."""
-        return (0 <= r < BOARD_SIZE) and (0 <= c < BOARD_SIZE)
+        return EMPTY
 
     def get_value(self, r: int, c: int):
         """Devolve o valor na respetiva posição do tabuleiro."""
-        return self.grid[r][c] if self.is_pos_valid(r, c) else EMPTY
+        if not self.is_pos_valid(r, c):
+            return EMPTY
+
+        b = self.geometry.bit(r, c)
+
+        if (self.water & b):
+            return WATER
+
+        if (self.ship & b):
+            for piece, mask in self.pieces.items():
+                if (mask & b):
+                    return piece
+
+        return EMPTY
 
     def set_value(self, r: int, c: int, value: str):
         """Define um novo valor para a posição dada."""
         if not self.is_pos_valid(r, c):
             return
         
-        if (self.grid[r][c] is EMPTY):
+        b = self.geometry.bit(r, c)
+        hint = self.get_hint(r, c)
+
+        if (hint is not EMPTY):
+            self.unsatisfied += (self.get_value(r, c) == hint.lower()) - (value == hint.lower())
+
+        self.key ^= self.geometry.zobrist(self.ship & b, self.water & b)
+
+        if not ((self.ship | self.water) & b):
             self.h -= hcell
 
-            if (value.upper() == self.hints[r][c]):
+            if (value.upper() == hint):
                 self.h -= hhint
 
-        self.grid[r][c] = value
+        self.ship &= ~b
+        self.water &= ~b
+
+        for piece in PIECES:
+            self.pieces[piece] &= ~b
+
+        if (value == WATER):
+            self.water |= b
+            self.key ^= self.geometry.zobrist(0, b)
+        else:
+            self.ship |= b
+            self.pieces[value] |= b
+            self.key ^= self.geometry.zobrist(b, 0)
+
+    def fill_water(self, mask: int):
+        """Fills all the empty cells of the given mask with water (forced cells are kept)."""
+        empty = mask & ~(self.ship | self.water | self.forced)
+        self.h -= hcell * empty.bit_count()
+        self.water |= empty
+        self.key ^= self.geometry.zobrist(0, empty)
 
     def fill_row(self, r: int):
         """"Fills the given row with water."""
-        for c in range(BOARD_SIZE):
-            if (self.grid[r][c] is EMPTY):
-                self.set_value(r, c, WATER)
+        self.fill_water(self.geometry.row_masks[r])
 
     def fill_column(self, c: int):
         """Fills the given column with water."""
-        for r in range(BOARD_SIZE):
-            if (self.grid[r][c] is EMPTY):
-                self.set_value(r, c, WATER)
+        self.fill_water(self.geometry.col_masks[c])
     
     def fill_zeros(self):
         """Fills all complete rows and columns (whose values are 0) with water."""
-        for i in range(BOARD_SIZE):
+        for i in range(self.geometry.size):
             if not self.row_values[i]:
                 self.fill_row(i)
             
             if not self.col_values[i]:
                 self.fill_column(i)
     
-    def fits_vboat(self, r: int, c: int, size: int):
-        """Returns True if it possible to insert a vertical boat in the given position."""
-        if (self.col_values[c] < size) or (r + size > BOARD_SIZE):
-            return False
-
-        for x in range(r, r+size):
-            if (self.grid[x][c] is not EMPTY):
-                return False
-        
-        return True
-    
-    def fits_hboat(self, r: int, c: int, size: int):
-        """Returns True if it is possible to insert a horizontal boat in the given position."""
-        if (self.row_values[r] < size) or (c + size > BOARD_SIZE):
-            return False
-
-        for x in range(c, c+size):
-            if (self.grid[r][x] is not EMPTY):
-                return False
-            
-        return True
-
-    
     def decrement_col_value(self, c: int, amnt: int):
         """Decrement the column value, and fills with water if its value reached 0."""
-        if (c < 0) or (c >= BOARD_SIZE):
+        if (c < 0) or (c >= self.geometry.size):
             return
         
+        self.record(self.col_values, c)
         self.col_values[c] -= amnt
+        self.remaining -= amnt
 
         if not self.col_values[c]:
             self.fill_column(c)
     
     def decrement_row_value(self, r: int, amnt: int):
         """Decrement the row value, and fills with water if its value reached 0."""
-        if (r < 0) or (r >= BOARD_SIZE):
+        if (r < 0) or (r >= self.geometry.size):
             return
         
+        self.record(self.row_values, r)
         self.row_values[r] -= amnt
+        self.remaining -= amnt
 
         if not self.row_values[r]:
             self.fill_row(r)
@@ -165,128 +395,304 @@ class Board:
         where the first two values are its position, the third is its size and the fourth
         is a boolean indicating its direction (True = vertical, False = horizontal).
         """
-        size = len(self.boats)
+        if not self.consistent:
+            return ()
 
-        for i in range(size):
-            if self.boats[i]:
-                size -= i
-                break
-        else:
+        hinted = self.hinted()
+        conflicts = self.hint_conflicts(hinted)
+        placements = {}
+
+        for size in range(1, len(self.boats) + 1):
+            if self.boats[-size]:
+                placements[size] = [action for action in self.generate_placements(size)
+                                    if self.fits_hints(action, conflicts)]
+
+        if (self.last is not None) and (self.last[0] in placements):
+            size, index = self.last
+            placements[size] = [action for action in placements[size] if self.geometry.placement_index(*action) > index]
+
+        if not (placements and self.is_feasible(placements)):
             return ()
-        
-        result = []
 
-        if (size == 1):
-            for r in range(BOARD_SIZE):
-                if not self.row_values[r]:
-                    continue
+        # Boats covering more hints are explored first (depth first search pops from the end).
+        unsatisfied = hinted & ~self.ship
+        result = placements[max(placements)]
+        result.sort(key=lambda action: (self.geometry.boat_masks(action)[0] & unsatisfied).bit_count())
+        return result
 
-                for c in range(BOARD_SIZE):
-                    if (self.grid[r][c] is EMPTY):
-                        result.append((r, c, size))
+    def hinted(self):
+        """Returns the mask of the cells with a hint of a piece (all hints but 'W')."""
+        hinted = 0
 
-            return () if (len(result) < self.boats[-size]) else result
-        
-        for i in range(BOARD_SIZE):
-            for j in range(11 - size):
-                if self.fits_vboat(j, i, size):
-                    result.append((j, i, size, True))
+        for hint, mask in self.hints.items():
+            if (hint != 'W'):
+                hinted |= mask
+
+        return hinted
+
+    def hint_conflicts(self, hinted: int):
+        """Returns a dictionary with the mask of the hinted cells where each piece can not be placed."""
+        return {piece: hinted & ~self.hints.get(piece.upper(), 0) for piece in PIECES}
+
+    def fits_hints(self, action: tuple, conflicts: dict):
+        """Returns True if the given action does not place a piece on a hint of another piece."""
+        for piece, mask in self.geometry.boat_masks(action)[2]:
+            if (mask & conflicts[piece]):
+                return False
+
+        return True
+
+    def generate_placements(self, size: int):
+        """Generate all actions that insert a boat of the given size (see generate_actions)."""
+        occupied = self.ship | self.water
+        result = []
 
-                if self.fits_hboat(i, j, size):
-                    result.append((i, j, size, False))
+        for action, cells, ring, _ in self.geometry.placements(size):
+            # A vertical boat needs size cells of its column, an horizontal one of its row.
+            if (size > 1) and action[3]:
+                value = self.col_values[action[1]]
+            else:
+                value = self.row_values[action[0]]
+
+            if (value >= size) and not ((cells & occupied) or (ring & self.forced)):
+                result.append(action)
 
         return result
 
+    def is_feasible(self, placements: dict):
+        """Returns False if this board can be proven to have no solution, given the actions
+        available for each size of boat that is left to insert (see generate_placements).
+
+        Rows and columns with more ship cells left than empty cells are already
+        detected by propagate_lines, so they are not checked again here."""
+        needed = sum(size * self.boats[-size] for size in range(1, len(self.boats) + 1))
+
+        if (sum(self.row_values) != needed) or (sum(self.col_values) != needed):
+            return False
+
+        covered = 0
+
+        for size, actions in placements.items():
+            if (len(actions) < self.boats[-size]):
+                return False
+
+            for action in actions:
+                covered |= self.geometry.boat_masks(action)[0]
+
+        # Every forced cell (e.g. of an 'M' hint) must still be part of some boat.
+        return not (self.forced & ~covered)
+
+    def take_boat(self, size: int):
+        """Removes a boat of the given size from the boats left to insert."""
+        self.key ^= self.geometry.boat_key(size, self.boats[-size]) ^ self.geometry.boat_key(size, self.boats[-size] - 1)
+        self.record(self.boats, len(self.boats) - size)
+        self.boats[-size] -= 1
+
+    def place_boat(self, r: int, c: int, size: int, vertical = False):
+        """Inserts a boat in this board, surrounding it with water."""
+        cells, ring, pieces = self.geometry.boat_masks((r, c, size, vertical))
+        filled = self.ship | self.water
+
+        self.h -= hcell * ((cells | ring) & ~filled).bit_count()
+
+        for piece, mask in pieces:
+            satisfied = (mask & self.hints.get(piece.upper(), 0) & ~filled).bit_count()
+            self.unsatisfied -= satisfied
+            self.h -= hhint * satisfied
+            self.pieces[piece] |= mask
+
+        self.key ^= self.geometry.zobrist(cells & ~self.ship, ring & ~self.water)
+        self.ship |= cells
+        self.water |= ring
+        self.forced &= ~cells
+
+        if (vertical):
+            self.decrement_col_value(c, size)
+
+            for x in range(r, r + size):
+                self.decrement_row_value(x, 1)
+        else:
+            self.decrement_row_value(r, size)
+
+            for y in range(c, c + size):
+                self.decrement_col_value(y, 1)
     
     def execute_action(self, r: int, c: int, size: int, vertical = False):
         """Executes an action (inserts a boat), ideally generated by generate_actions."""
         clone = self.__clone__()
 
         clone.h -= hboat
-        clone.boats[-size] -= 1
-
-        clone.set_value(r - 1, c - 1, WATER)
-        clone.set_value(r - 1, c, WATER)
-        clone.set_value(r, c - 1, WATER)
-
-        if (size == 1):
-            clone.set_value(r, c, CIRCLE)
-            clone.set_value(r + 1, c, WATER)
-            clone.set_value(r, c + 1, WATER)
-            clone.set_value(r - 1, c + 1, WATER)
-            clone.set_value(r + 1, c - 1, WATER)
-            clone.set_value(r + 1, c + 1, WATER)
-            clone.decrement_row_value(r, 1)
-            clone.decrement_col_value(c, 1)
-            return clone
-
-        if (vertical):
-            clone.decrement_col_value(c, size)
-            clone.decrement_row_value(r, 1)
-            clone.set_value(r, c, TOP)
-            clone.set_value(r - 1, c + 1, WATER)
-            clone.set_value(r, c + 1, WATER)
-
-            if (size > 2):
-                r += 1
-                clone.set_value(r, c, MID)
-                clone.set_value(r, c - 1, WATER)
-                clone.set_value(r, c + 1, WATER)
-                clone.decrement_row_value(r, 1)
-
-                if (size > 3):
-                    r += 1
-                    clone.set_value(r, c, MID)
-                    clone.set_value(r, c + 1, WATER)
-                    clone.set_value(r, c - 1, WATER)
-                    clone.decrement_row_value(r, 1)
-            
-            r += 1
-            clone.set_value(r, c, BOT)
-            clone.set_value(r, c - 1, WATER)
-            clone.set_value(r, c + 1, WATER)
-            clone.set_value(r + 1, c, WATER)
-            clone.set_value(r + 1, c - 1, WATER)
-            clone.set_value(r + 1, c + 1, WATER)
-            clone.decrement_row_value(r, 1)
-            return clone
-
-        clone.decrement_col_value(c, 1)
-        clone.decrement_row_value(r, size)
-        clone.set_value(r, c, LEFT)
-        clone.set_value(r + 1, c - 1, WATER)
-        clone.set_value(r + 1, c, WATER)
-
-        if (size > 2):
-            c += 1
-            clone.set_value(r, c, MID)
-            clone.set_value(r - 1, c, WATER)
-            clone.set_value(r + 1, c, WATER)
-            clone.decrement_col_value(c, 1)
-
-            if (size > 3):
-                c += 1
-                clone.set_value(r, c, MID)
-                clone.set_value(r - 1, c, WATER)
-                clone.set_value(r + 1, c, WATER)
-                clone.decrement_col_value(c, 1)
-        
-        c += 1
-        clone.set_value(r, c, RIGHT)
-        clone.set_value(r, c + 1, WATER)
-        clone.set_value(r - 1, c, WATER)
-        clone.set_value(r + 1, c, WATER)
-        clone.set_value(r - 1, c + 1, WATER)
-        clone.set_value(r + 1, c + 1, WATER)
-        clone.decrement_col_value(c, 1)
+        clone.take_boat(size)
+        clone.place_boat(r, c, size, vertical)
+        clone.consistent = clone.propagate()
         return clone
+
+    def apply(self, r: int, c: int, size: int, vertical = False):
+        """Executes an action like execute_action, but on this board instead of a clone.
+        The values it changes are saved in a trail, so that undo can restore them."""
+        if self.frames is None:
+            self.trail, self.frames = [], []
+
+        self.frames.append((len(self.trail), self.h, self.ship, self.water, self.forced, self.unsatisfied,
+                            self.remaining, self.key, self.last, self.consistent, tuple(self.pieces.values())))
+        self.h -= hboat
+        self.take_boat(size)
+        self.place_boat(r, c, size, vertical)
+        self.consistent = self.propagate()
+
+    def undo(self):
+        """Undoes the last apply that was not undone yet."""
+        (mark, self.h, self.ship, self.water, self.forced, self.unsatisfied,
+         self.remaining, self.key, self.last, self.consistent, pieces) = self.frames.pop()
+        self.pieces.update(zip(self.pieces, pieces))
+
+        while (len(self.trail) > mark):
+            values, i, value = self.trail.pop()
+            values[i] = value
+
+    def inserted(self):
+        """Returns the number of boats inserted by the last apply that was not undone
+        (including the ones completed by propagation)."""
+        return sum(values is self.boats for values, _, _ in self.trail[self.frames[-1][0]:])
+
+    def record(self, values: list, i: int):
+        """Saves values[i] in the trail before it is changed, if there is an apply to undo."""
+        if self.frames:
+            self.trail.append((values, i, values[i]))
+
+    def propagate(self):
+        """Deduces as many cells as possible, until a fixpoint is reached.
+
+        Boats whose cells are all forced and enclosed by water are inserted as well.
+        Returns False if this board was found to have no solution."""
+        while True:
+            before = (self.ship, self.water, self.forced)
+
+            if not (self.propagate_hints() and self.propagate_lines()):
+                return False
+
+            around = self.geometry.diagonals(self.forced)
+
+            if (around & self.forced) or (self.forced & self.water):
+                return False
+
+            self.fill_water(around)
+
+            if not self.complete_boats():
+                return False
+
+            if (before == (self.ship, self.water, self.forced)):
+                return True
+
+    def propagate_hints(self):
+        """Forces the cells of the hints, and the cells next to them that must be part of the same boat.
+        Returns False if some hint can not be completed."""
+        self.forced |= self.hinted() & ~self.ship
+
+        # Directional hints point to the next piece of their boat (e.g. the cell below a 't').
+        for hint, (dr, dc) in HINT_NEIGHBOURS.items():
+            mask = self.hints.get(hint, 0) & ~self.ship
+            moved = self.geometry.shift(mask, dr, dc)
+
+            if (moved.bit_count() != mask.bit_count()):
+                return False
+
+            self.forced |= moved
+
+        # A middle piece closed on one side continues in the other direction.
+        mids = self.hints.get('M', 0) & ~self.ship
+        vertical = mids & (self.geometry.shift(self.water, 0, 1) | self.geometry.shift(self.water, 0, -1) | self.geometry.col_masks[0] | self.geometry.col_masks[-1])
+        horizontal = mids & (self.geometry.shift(self.water, 1, 0) | self.geometry.shift(self.water, -1, 0) | self.geometry.row_masks[0] | self.geometry.row_masks[-1])
+
+        if (vertical & horizontal):
+            return False
+
+        self.forced |= self.geometry.shift(vertical, -1, 0) | self.geometry.shift(vertical, 1, 0)
+        self.forced |= self.geometry.shift(horizontal, 0, -1) | self.geometry.shift(horizontal, 0, 1)
+        return True
+
+    def propagate_lines(self):
+        """Fills the rows and columns whose value is already met by forced cells with water, and
+        forces the empty cells of the ones that have as many empty cells as their value.
+        Returns False if some row or column can not be completed."""
+        for values, masks in ((self.row_values, self.geometry.row_masks), (self.col_values, self.geometry.col_masks)):
+            for i in range(self.geometry.size):
+                empty = masks[i] & ~(self.ship | self.water)
+                forced = (empty & self.forced).bit_count()
+                value = values[i]
+
+                if (forced > value) or (empty.bit_count() < value):
+                    return False
+
+                if (forced == value):
+                    self.fill_water(empty)
+                elif (empty.bit_count() == value):
+                    self.forced |= empty
+
+        return True
+
+    def is_closed(self, r: int, c: int):
+        """Returns True if the given position is outside the board or has water."""
+        return not self.is_pos_valid(r, c) or bool(self.water & self.geometry.bit(r, c))
+
+    def complete_boats(self):
+        """Inserts the boats whose cells are all forced and enclosed by water.
+        Returns False if some of them does not belong to the fleet, touches another boat
+        or contradicts a hint."""
+        conflicts = self.hint_conflicts(self.hinted())
+
+        for r, c in self.geometry.bits(self.forced):
+            if not (self.forced & self.geometry.bit(r, c)):
+                continue  # Already inserted as part of a previous boat.
+
+            if (self.forced & (self.geometry.shift(self.geometry.bit(r, c), 0, -1) | self.geometry.shift(self.geometry.bit(r, c), -1, 0))):
+                continue  # Not the first cell of its boat.
+
+            hsize = vsize = 1
+
+            while (c + hsize < self.geometry.size) and (self.forced & self.geometry.bit(r, c + hsize)):
+                hsize += 1
+
+            while (r + vsize < self.geometry.size) and (self.forced & self.geometry.bit(r + vsize, c)):
+                vsize += 1
+
+            if (hsize > 1) and (vsize > 1):
+                return False
+
+            vertical = vsize > 1
+            size = vsize if vertical else hsize
+
+            if not (self.is_closed(r - 1, c) and self.is_closed(r, c - 1)):
+                continue
+
+            if vertical and not (self.is_closed(r + size, c)):
+                continue
+
+            if not vertical and not (self.is_closed(r, c + size) and (size > 1 or self.is_closed(r + 1, c))):
+                continue
+
+            if (size > len(self.boats)) or not self.boats[-size]:
+                return False
+
+            if (self.geometry.boat_masks((r, c, size, vertical))[1] & (self.ship | self.forced)):
+                return False
+
+            if not self.fits_hints((r, c, size, vertical), conflicts):
+                return False
+
+            self.h -= hboat
+            self.take_boat(size)
+            self.place_boat(r, c, size, vertical)
+
+        return True
     
     def add_hint(self, r: int, c: int, value: str):
         """Adds a hint."""
         if not self.is_pos_valid(r, c):
             return
 
-        self.hints[r][c] = value
+        self.hints[value] = self.hints.get(value, 0) | self.geometry.bit(r, c)
+        self.unsatisfied += self.get_value(r, c) != value.lower()
 
         if (value == 'W'):
             self.set_value(r, c, WATER)
@@ -311,7 +717,7 @@ class Board:
             self.set_value(r, c + 1, WATER)
             self.decrement_col_value(c, 1)
             self.decrement_row_value(r, 1)
-            self.boats[-1] -= 1
+            self.take_boat(1)
         elif (value == 'L'):
             # . . . (row - 1)
             # . l ? (row)
@@ -345,12 +751,12 @@ class Board:
     def print(self):
         line = ''
 
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                value = self.hints[r][c]
+        for r in range(self.geometry.size):
+            for c in range(self.geometry.size):
+                value = self.get_hint(r, c)
 
                 if (value is EMPTY):
-                    value = self.grid[r][c]
+                    value = self.get_value(r, c)
 
                     if (value is WATER):
                         value = '.'
@@ -364,32 +770,40 @@ class Board:
         print(line, end="")
 
     @staticmethod
-    def parse_instance():
+    def parse_instance(boats = None, stream = None):
         """Lê o test do standard input (stdin) que é passado como argumento
         e retorna uma instância da classe Board.
 
+        The size of the board is given by the number of row values. The fleet
+        defaults to BOATS. Another stream can be given to read the instance from.
+
         Por exemplo:
             $ python3 bimaru.py < input_T01
 
             > from sys import stdin
             > line = stdin.readline().split()
         """
-        row_values = [int(i) for i in stdin.readline().split()[1:]]
-        col_values = [int(i) for i in stdin.readline().split()[1:]]
-        hints = int(stdin.readline())
-        board = Board(row_values, col_values, hints * hhint + hcell * 100 + hboat * 10)
+        stream = stdin if stream is None else stream
+        row_values = [int(i) for i in stream.readline().split()[1:]]
+        col_values = [int(i) for i in stream.readline().split()[1:]]
+        hints = int(stream.readline())
+        boats = (BOATS if boats is None else boats).copy()
+        h = hints * hhint + hcell * len(row_values) ** 2 + hboat * sum(boats)
+        board = Board(row_values, col_values, h, boats = boats)
 
         for _ in range(hints):
-            line = stdin.readline().split()[1:]  # Ignores 'HINT\t'
+            line = stream.readline().split()[1:]  # Ignores 'HINT\t'
 
             board.add_hint(int(line[0]), int(line[1]), line[2])
         
         board.fill_zeros()
+        board.consistent = board.propagate()
 
         return board
 
 
 class BimaruState:
+    __slots__ = ('board', 'id')
     state_id = 0
 
     def __init__(self, board: Board):
@@ -400,12 +814,26 @@ class BimaruState:
     def __lt__(self, other):
         return self.id > other.id
 
+    def __eq__(self, other):
+        return isinstance(other, BimaruState) and self.board == other.board
+
+    def __hash__(self):
+        return hash(self.board)
+
 
 class Bimaru(Problem):
 
-    def __init__(self, board: Board):
-        """O construtor especifica o estado inicial."""
+    def __init__(self, board: Board, break_symmetry = False, heuristic = heuristics.weights):
+        """O construtor especifica o estado inicial.
+
+        If break_symmetry is True, boats of the same size are only inserted in the
+        order given by placement_index, so each set of boats is reached only once.
+        heuristic is a function of a Board used by h (see heuristics.py). If it is one of
+        heuristics.BOAT_COSTS, the cost of an action is the boats it inserts, or else 1."""
         super().__init__(BimaruState(board))
+        self.break_symmetry = break_symmetry
+        self.heuristic = heuristic
+        self.boat_costs = heuristic in heuristics.BOAT_COSTS
 
     def actions(self, state: BimaruState):
         """Retorna uma lista de ações que podem ser executadas a
@@ -417,7 +845,24 @@ class Bimaru(Problem):
         'state' passado como argumento. A ação a executar deve ser uma
         das presentes na lista obtida pela execução de
         self.actions(state)."""
-        return BimaruState(state.board.execute_action(*action))
+        board = state.board.execute_action(*action)
+
+        if self.break_symmetry:
+            board.last = (action[2], board.geometry.placement_index(*action))
+
+        return BimaruState(board)
+
+    def apply(self, state: BimaruState, action):
+        """Executes the action on the board of the given state itself (see backtracking_search)."""
+        board = state.board
+        board.apply(*action)
+
+        if self.break_symmetry:
+            board.last = (action[2], board.geometry.placement_index(*action))
+
+    def undo(self, state: BimaruState, action):
+        """Undoes the last action applied to the given state."""
+        state.board.undo()
 
     def goal_test(self, state: BimaruState):
         """Retorna True se e só se o estado passado como argumento é
@@ -425,9 +870,21 @@ class Bimaru(Problem):
         estão preenchidas de acordo com as regras do problema."""
         return state.board.is_goal()
 
+    def path_cost(self, c, state1: BimaruState, action, state2: BimaruState):
+        """Each action costs 1, or with boat_costs each boat inserted costs 1, including
+        the ones completed by propagation."""
+        if not self.boat_costs:
+            return c + 1
+
+        if state1 is state2:
+            # Changed in place by apply (see backtracking_search).
+            return c + state2.board.inserted()
+
+        return c + sum(state1.board.boats) - sum(state2.board.boats)
+
     def h(self, node: Node):
         """Função heuristica utilizada para a procura A*."""
-        return node.state.board.h
+        return self.heuristic(node.state.board)
 
     # TODO: outros metodos da classe
 
@@ -445,19 +902,250 @@ def example2():
     print(result_state.board.get_value(3, 3))
 
 
-def test():
-    problem = Bimaru(Board.parse_instance())
-    goal = depth_first_tree_search(problem)
+# Searches that can be chosen with --search.
+SEARCHES = {search.__name__: search for search in (
+    depth_first_transposition_search,
+    depth_first_tree_search,
+    recursive_backtracking_search,
+    backtracking_search,
+    depth_first_graph_search,
+    breadth_first_tree_search,
+    breadth_first_graph_search,
+    greedy_search,
+    astar_search,
+    iterative_deepening_astar_search,
+)}
+
+
+# Searches that --processes can split, and whether they keep a transposition table.
+PARALLEL_SEARCHES = {
+    'depth_first_transposition_search': True,
+    'depth_first_tree_search': False,
+}
+
 
-    if goal is None:
+# Configurations (solver, search) raced by --portfolio.
+PORTFOLIO = (
+    ('search', 'depth_first_tree_search'),
+    ('search', 'depth_first_transposition_search'),
+    ('search', 'greedy_search'),
+    ('search', 'astar_search'),
+    ('dlx', None),
+    ('sat', None),
+)
+
+
+def parse_arguments(argv = None):
+    """Parses the command line options of this script (or the given list of arguments)."""
+    parser = ArgumentParser(description='Solves a Bimaru instance given in the standard input.')
+    parser.add_argument('--break-symmetry', action='store_true',
+                        help='insert boats of the same size in a fixed order')
+    parser.add_argument('--solver', choices=('search', 'dlx', 'sat'), default='search',
+                        help='solve with the tree search, dancing links or the SAT solver (default: %(default)s)')
+    parser.add_argument('--search', choices=SEARCHES, default='depth_first_transposition_search',
+                        help='search used by the search solver (default: %(default)s)')
+    parser.add_argument('--heuristic', choices=heuristics.HEURISTICS, default='weights',
+                        help='heuristic of the greedy and A* searches (see heuristics.py) (default: %(default)s)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='split the search over this many processes (see parallel.py) (default: %(default)s)')
+    parser.add_argument('--portfolio', action='store_true',
+                        help='race the configurations of PORTFOLIO in separate processes, keeping the first solution '
+                             '(with --stats, only the winning configuration is written)')
+    parser.add_argument('--stats', action='store_true',
+                        help='write statistics of the search (see search.ProfiledProblem) to stderr as JSON')
+    parser.add_argument('--solutions', type=int, metavar='LIMIT',
+                        help='print every solution (up to LIMIT, 0 for no limit) and how many were found')
+    parser.add_argument('--boats', nargs='+', type=int, default=BOATS,
+                        help='number of boats of each size, from the largest to the smallest (default: %(default)s)')
+    parser.add_argument('--batch', action='store_true',
+                        help='solve every instance of the standard input (or of the given files) in this process')
+    parser.add_argument('instances', nargs='*',
+                        help='files with one or more instances to solve in batch')
+    args = parser.parse_args(argv)
+
+    if (args.processes > 1):
+        if (args.solver != 'search') or (args.search not in PARALLEL_SEARCHES):
+            parser.error('--processes only splits the searches %s' % ', '.join(PARALLEL_SEARCHES))
+
+        if args.stats:
+            parser.error('--stats can not be used with --processes')
+
+    if (args.solver != 'search'):
+        # The dlx and sat solvers do not build a search problem.
+        ignored = [option for option, given in (
+            ('--search', args.search != parser.get_default('search')),
+            ('--heuristic', args.heuristic != parser.get_default('heuristic')),
+            ('--break-symmetry', args.break_symmetry),
+            ('--stats', args.stats),
+        ) if given]
+
+        if ignored:
+            parser.error('--solver %s can not be used with %s' % (args.solver, ', '.join(ignored)))
+
+    if (args.solutions is not None):
+        if (args.solutions < 0):
+            parser.error('--solutions must be 0 (no limit) or more')
+
+        # The solutions are enumerated by depth_first_solutions, in this process.
+        ignored = [option for option, given in (
+            ('--solver', args.solver != 'search'),
+            ('--search', args.search != parser.get_default('search')),
+            ('--heuristic', args.heuristic != parser.get_default('heuristic')),
+            ('--processes', args.processes > 1),
+            ('--portfolio', args.portfolio),
+        ) if given]
+
+        if ignored:
+            parser.error('--solutions can not be used with %s' % ', '.join(ignored))
+
+    return args
+
+
+def solve(board: Board, args, wrap = None):
+    """Solves the board with the solver chosen in args (see parse_arguments).
+    Returns the solved board, or None if there is no solution. The search problem
+    is passed to wrap, if given (e.g. search.InstrumentedProblem)."""
+    # The other solvers and multiprocessing are only imported when used, to keep the startup short.
+    if args.portfolio:
+        import parallel
+        configurations = [Namespace(**dict(vars(args), solver=solver, search=search or args.search,
+                                           portfolio=False, processes=1, stats=False))
+                          for solver, search in PORTFOLIO]
+        winner, solved = parallel.race([partial(solve, board, configuration) for configuration in configurations])
+
+        if args.stats:
+            print(json.dumps({'portfolio': None if winner is None else PORTFOLIO[winner]}), file=stderr)
+
+        return solved
+
+    if (args.solver == 'dlx'):
+        import dlx
+        return dlx.solve(board)
+
+    if (args.solver == 'sat'):
+        import sat
+        return sat.solve(board)
+
+    problem = Bimaru(board, args.break_symmetry, heuristics.HEURISTICS[args.heuristic])
+
+    if (args.processes > 1):
+        import parallel
+        goal = parallel.parallel_search(problem, args.processes, transpositions=PARALLEL_SEARCHES[args.search])
+    elif args.stats:
+        profiled = ProfiledProblem(problem)
+        goal = profiled.run(SEARCHES[args.search])
+        print(json.dumps(profiled.summary()), file=stderr)
+    else:
+        goal = SEARCHES[args.search](problem if wrap is None else wrap(problem))
+
+    return None if goal is None else goal.state.board
+
+
+def solutions(problem: Bimaru):
+    """Yields every solution of the problem (as solved boards), each one once. The
+    search goes on from where the last solution was found (see depth_first_solutions),
+    keeping the propagation of each board and the transposition table."""
+    found = set()
+
+    for node in depth_first_solutions(problem):
+        solved = node.state.board
+
+        # Boards with the same ship cells are the same solution (reached with another last boat).
+        if solved.ship not in found:
+            found.add(solved.ship)
+            yield solved
+
+
+def print_solutions(board: Board, args):
+    """Prints the first args.solutions solutions of the board (all of them if 0),
+    each one after a line '# solution <n>', and then a line '# solutions: <count>'
+    (with a '+' if the limit was reached, as there may be more). With args.stats,
+    the statistics of the enumeration are written to stderr (see solve)."""
+    def show(problem):
+        count = 0
+
+        for count, solved in enumerate(islice(solutions(problem), args.solutions or None), 1):
+            print('# solution %d' % count)
+            solved.print()
+
+        return count
+
+    problem = Bimaru(board, args.break_symmetry)
+
+    if args.stats:
+        profiled = ProfiledProblem(problem)
+        count = profiled.run(show)
+        profiled.search = depth_first_solutions.__name__
+        print(json.dumps(profiled.summary()), file=stderr)
+    else:
+        count = show(problem)
+
+    print('# solutions: %d%s' % (count, '+' if args.solutions and (count == args.solutions) else ''))
+
+
+def read_instances(stream):
+    """Yields a stream with each instance of a stream of concatenated instances
+    (blank lines between them are ignored)."""
+    lines = (line for line in stream if line.strip())
+
+    for row in lines:
+        column = next(lines)
+        count = next(lines)
+        hints = [next(lines) for _ in range(int(count))]
+        yield StringIO(''.join([row, column, count] + hints))
+
+
+def batch(args):
+    """Solves every instance of the given files (or of the standard input) in this
+    process, so that the interpreter startup, the imports and the placement tables
+    of each board size (see get_geometry) are shared by all of them. Each solution
+    is printed in order after a line '# <source>:<n>', n counting from 1 in each source."""
+    for source in args.instances or ['-']:
+        file = stdin if (source == '-') else open(source)
+        name = 'stdin' if (source == '-') else source
+
+        for n, stream in enumerate(read_instances(file), 1):
+            print('# %s:%d' % (name, n))
+            board = Board.parse_instance(args.boats, stream)
+
+            if args.solutions is not None:
+                print_solutions(board, args)
+                continue
+
+            solved = solve(board, args)
+
+            if solved is None:
+                print('Error: goal is none!')
+            else:
+                solved.print()
+
+        if file is not stdin:
+            file.close()
+
+
+def test(args):
+    board = Board.parse_instance(args.boats)
+
+    if args.solutions is not None:
+        print_solutions(board, args)
+        return
+
+    solved = solve(board, args)
+
+    if solved is None:
         print('Error: goal is none!')
         return
 
-    goal.state.board.print()
+    solved.print()
 
 
 if __name__ == "__main__":
-    test()
+    arguments = parse_arguments()
+
+    if arguments.batch or arguments.instances:
+        batch(arguments)
+    else:
+        test(arguments)
 
     # TODO:
     # Ler o ficheiro do standard input,
@@ -0,0 +1,291 @@
+# dlx.py: Dancing links (Algorithm X) solver for Bimaru.
+#
+# Bimaru is encoded as a generalized exact cover problem, where each option is
+# the placement of a boat:
+#   - each boat size must be covered as many times as there are boats of that size left;
+#   - each row and column must be covered as many times as its value (a boat covers
+#     its row or column once for each of its cells in it);
+#   - each forced cell (known to be part of a boat) must be covered once;
+#   - the other empty cells are secondary items: a boat takes its own cells for itself
+#     and colors the cells around it with water, which other boats can share.
+
+WATER = 'w'
+
+
+class DancingLinks:
+    """Dancing links (Algorithm X) for generalized exact cover problems.
+
+    primary maps each primary item to the number of times it must be covered.
+    Each option is a list of (item, value) pairs: for a primary item, value is how
+    many times the option covers it; for a secondary item, value is a color, or None
+    if the option needs the item for itself. Options may only share a secondary item
+    if they give it the same color.
+
+    The matrix is kept as circular doubly linked lists (one per item) in flat arrays.
+    Every option removed from the lists is recorded in a trail, so that the search can
+    restore them in reverse order when it backtracks."""
+
+    def __init__(self, primary: dict, options: list):
+        self.options = options
+        items = list(primary)
+
+        for option in options:
+            for item, _ in option:
+                if item not in primary and item not in items:
+                    items.append(item)
+
+        index = {item: i + 1 for i, item in enumerate(items)}
+        n = len(items) + 1
+
+        # Node 0 is the root, nodes 1..len(items) are the item headers.
+        self.up = list(range(n))
+        self.down = list(range(n))
+        self.top = list(range(n))
+        self.value = [None] * n
+        self.owner = [None] * n
+        self.length = [0] * n
+        self.need = [0] * n
+        self.items = [None] + items
+
+        # Only primary items are linked in the header list.
+        self.left = list(range(n))
+        self.right = list(range(n))
+
+        for item in primary:
+            i = index[item]
+            self.need[i] = primary[item]
+            self.left[i] = self.left[0]
+            self.right[i] = 0
+            self.right[self.left[0]] = i
+            self.left[0] = i
+
+        self.primary = [False] * n
+
+        for item in primary:
+            self.primary[index[item]] = True
+
+        self.nodes = []
+
+        for o, option in enumerate(options):
+            nodes = []
+
+            for item, value in option:
+                i = index[item]
+                node = len(self.top)
+                self.top.append(i)
+                self.value.append(value)
+                self.owner.append(o)
+                self.up.append(self.up[i])
+                self.down.append(i)
+                self.down[self.up[i]] = node
+                self.up[i] = node
+                self.length[i] += 1
+                nodes.append(node)
+
+            self.nodes.append(nodes)
+
+        self.alive = [True] * len(options)
+        self.trail = []
+
+        for item in primary:
+            for node in self.column(index[item]):
+                if (self.value[node] > self.need[index[item]]) and self.alive[self.owner[node]]:
+                    self.hide(self.owner[node])
+
+    def hide(self, o: int):
+        """Removes the option o from the lists of all its items."""
+        self.alive[o] = False
+        self.trail.append(('option', o))
+
+        for node in self.nodes[o]:
+            self.down[self.up[node]] = self.down[node]
+            self.up[self.down[node]] = self.up[node]
+            self.length[self.top[node]] -= 1
+
+    def unhide(self, o: int):
+        """Puts the option o back in the lists of all its items (undoes hide)."""
+        for node in reversed(self.nodes[o]):
+            self.down[self.up[node]] = node
+            self.up[self.down[node]] = node
+            self.length[self.top[node]] += 1
+
+        self.alive[o] = True
+
+    def deactivate(self, i: int):
+        """Removes the primary item i from the header list (it is fully covered)."""
+        self.trail.append(('item', i))
+        self.right[self.left[i]] = self.right[i]
+        self.left[self.right[i]] = self.left[i]
+
+    def undo(self, mark: int):
+        """Undoes every change recorded in the trail after the given mark."""
+        while len(self.trail) > mark:
+            kind, x = self.trail.pop()
+
+            if (kind == 'option'):
+                self.unhide(x)
+            elif (kind == 'item'):
+                self.right[self.left[x]] = x
+                self.left[self.right[x]] = x
+            else:
+                self.need[x[0]] += x[1]
+
+    def column(self, i: int):
+        """Returns the nodes currently in the list of item i."""
+        nodes = []
+        node = self.down[i]
+
+        while (node != i):
+            nodes.append(node)
+            node = self.down[node]
+
+        return nodes
+
+    def select(self, o: int):
+        """Chooses the option o, removing every option that became incompatible with it."""
+        self.hide(o)
+
+        for node in self.nodes[o]:
+            i = self.top[node]
+            value = self.value[node]
+
+            if self.primary[i]:
+                self.need[i] -= value
+                self.trail.append(('need', (i, value)))
+
+                if not self.need[i]:
+                    self.deactivate(i)
+
+                for other in self.column(i):
+                    if (self.value[other] > self.need[i]):
+                        self.hide(self.owner[other])
+            else:
+                for other in self.column(i):
+                    if (value is None) or (self.value[other] != value):
+                        self.hide(self.owner[other])
+
+    def choose(self):
+        """Returns the active primary item with the fewest options (0 if there is none)."""
+        best = 0
+        i = self.right[0]
+
+        while (i != 0):
+            if not best or (self.length[i] < self.length[best]):
+                best = i
+
+                if not self.length[i]:
+                    break
+
+            i = self.right[i]
+
+        return best
+
+    def solutions(self):
+        """Yields every solution, as a list with the indices of the chosen options."""
+        chosen = []
+
+        def search():
+            i = self.choose()
+
+            if not i:
+                yield list(chosen)
+                return
+
+            nodes = self.column(i)
+
+            # The options left can not cover the item as many times as needed.
+            if (sum(self.value[node] for node in nodes) < self.need[i]):
+                return
+
+            mark = len(self.trail)
+
+            for node in nodes:
+                o = self.owner[node]
+
+                if not self.alive[o]:
+                    continue
+
+                branch = len(self.trail)
+                self.select(o)
+                chosen.append(o)
+
+                yield from search()
+
+                chosen.pop()
+                self.undo(branch)
+
+                # The solutions with this option were all found, so it is left out of
+                # the next branches (each solution is found only once).
+                self.hide(o)
+
+            self.undo(mark)
+
+        return search()
+
+
+def solve(board):
+    """Solves the given board (see bimaru.Board) with dancing links.
+    Returns a solved clone of the board, or None if it has no solution."""
+    if board.is_goal():
+        return board
+
+    if not board.consistent:
+        return None
+
+    geometry = board.geometry
+    conflicts = board.hint_conflicts(board.hinted())
+    empty = ~(board.ship | board.water | board.forced)
+    primary = {}
+
+    for size in range(1, len(board.boats) + 1):
+        if board.boats[-size]:
+            primary['boats', size] = board.boats[-size]
+
+    for r, value in enumerate(board.row_values):
+        if value:
+            primary['row', r] = value
+
+    for c, value in enumerate(board.col_values):
+        if value:
+            primary['col', c] = value
+
+    for r, c in geometry.bits(board.forced):
+        primary['cell', r, c] = 1
+
+    actions = []
+    options = []
+
+    for size in range(1, len(board.boats) + 1):
+        if not board.boats[-size]:
+            continue
+
+        for action in board.generate_placements(size):
+            if not board.fits_hints(action, conflicts):
+                continue
+
+            cells, ring, _ = geometry.boat_masks(action)
+            option = [(('boats', size), 1)]
+            lines = {}
+
+            for r, c in geometry.bits(cells):
+                lines['row', r] = lines.get(('row', r), 0) + 1
+                lines['col', c] = lines.get(('col', c), 0) + 1
+                option.append((('cell', r, c), 1 if (board.forced & geometry.bit(r, c)) else None))
+
+            option.extend(lines.items())
+            option.extend((('cell', r, c), WATER) for r, c in geometry.bits(ring & empty))
+            actions.append(action)
+            options.append(option)
+
+    for solution in DancingLinks(primary, options).solutions():
+        solved = board.__clone__()
+
+        for o in solution:
+            r, c, size = actions[o][:3]
+            solved.take_boat(size)
+            solved.place_boat(r, c, size, (size > 1) and actions[o][3])
+
+        if solved.is_goal():
+            return solved
+
+    return None
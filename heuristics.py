@@ -0,0 +1,84 @@
+# heuristics.py: Heuristics for the A* (and greedy) search of Bimaru.
+#
+# Every action costs 1 with the weights (as in the other searches). The bounds are
+# lower bounds on the boats left to insert, and with them Bimaru.path_cost counts
+# the boats inserted by each action, including the ones completed by propagation
+# (see BOAT_COSTS). Every path from a board to a goal then costs exactly the boats
+# left, sum(board.boats), and the perfect heuristic is sum(board.boats) for boards
+# that have a solution and infinity for the others. fleet_bound is never below
+# line_bound and hint_bound on a board with a solution, so these two are not used
+# as estimates (alone, they leave A* close to breadth first), but as tests: a board
+# needing more boats than its fleet has no solution. bound is the perfect heuristic
+# as far as those tests can tell: with it, g + h is the same for every node that is
+# not pruned, so A* only gains the pruning (and greedy search the order by boats left).
+#
+# The bounds only read the counters that Board keeps up to date as boats are
+# inserted (boats, remaining and consistent) and the hint masks, so they cost a
+# few bit counts per node instead of a scan of the grid.
+
+from math import inf
+
+
+def weights(board):
+    """The original heuristic: board.h, the weighted count of hints, cells and boats
+    left (see hhint, hcell and hboat in bimaru.py). It is not admissible."""
+    return board.h
+
+
+def fleet_bound(board):
+    """The number of boats left to insert."""
+    return sum(board.boats)
+
+
+def line_bound(board):
+    """A lower bound on the boats left from the row and column values: they must add
+    up to the cells of the fleet, and no boat is longer than the largest one left."""
+    cells = sum(size * board.boats[-size] for size in range(1, len(board.boats) + 1))
+
+    if (board.remaining != 2 * cells):
+        return inf
+
+    largest = max((size for size in range(1, len(board.boats) + 1) if board.boats[-size]), default=1)
+    return -(-cells // largest)
+
+
+def hint_bound(board):
+    """A lower bound on the boats left from the unsatisfied hints: each 'C' needs a
+    boat of size 1, a boat of size 2 or more satisfies at most two end hints ('T',
+    'B', 'L' and 'R') and a boat of size k at most k - 2 'M' hints."""
+    hints = board.hints
+    empty = ~board.ship
+    circles = (hints.get('C', 0) & empty).bit_count()
+    ends = (hints.get('T', 0) | hints.get('B', 0) | hints.get('L', 0) | hints.get('R', 0)) & empty
+    ends = -(-ends.bit_count() // 2)
+
+    mids = (hints.get('M', 0) & empty).bit_count()
+
+    if (circles > board.boats[-1]) or (ends > sum(board.boats[:-1])):
+        return inf
+
+    if mids and (mids > sum((size - 2) * board.boats[-size] for size in range(3, len(board.boats) + 1))):
+        return inf
+
+    return circles + ends
+
+
+def bound(board):
+    """The admissible heuristic: the boats left, or infinity if some bound shows
+    that the board has no solution."""
+    if not board.consistent:
+        return inf
+
+    boats = fleet_bound(board)
+
+    if (line_bound(board) > boats) or (hint_bound(board) > boats):
+        return inf
+
+    return boats
+
+
+# Heuristics that can be chosen with --heuristic (see bimaru.py).
+HEURISTICS = {heuristic.__name__: heuristic for heuristic in (weights, fleet_bound, bound)}
+
+# Heuristics that are lower bounds on the boats left, with which each boat costs 1.
+BOAT_COSTS = (fleet_bound, bound)
@@ -0,0 +1,226 @@
+# parallel.py: Parallel depth first search over a pool of processes.
+#
+# The first levels of the search tree are expanded breadth first in the calling
+# process, and the nodes found become the tasks of a shared queue. Each worker
+# searches the subtree of one task at a time, depth first. While some worker is
+# idle, the busy ones give away the shallowest node of their own stack (work
+# stealing), so that a large subtree is not left to a single worker. The first
+# goal found cancels every worker.
+#
+# The problem, the states and the nodes must be picklable.
+
+import multiprocessing
+from collections import deque
+from queue import Empty
+
+from search import Node
+
+# Nodes expanded by a worker between two checks for cancellation and idle workers.
+CHECK_EVERY = 16
+
+
+def split(problem, count: int):
+    """Expands the search tree breadth first until there are at least count nodes
+    in the frontier (or there is nothing left to expand). Returns a goal node found
+    on the way (or None) and the nodes of the frontier."""
+    frontier = deque([Node(problem.initial)])
+
+    if problem.goal_test(problem.initial):
+        return frontier[0], []
+
+    while frontier and len(frontier) < count:
+        node = frontier.popleft()
+
+        for child in node.expand(problem):
+            if problem.goal_test(child.state):
+                return child, []
+
+            frontier.append(child)
+
+    return None, list(frontier)
+
+
+def subtree_search(problem, node, transpositions: bool, shared):
+    """Searches the subtree of node depth first (like depth_first_transposition_search
+    if transpositions, or else like depth_first_tree_search). Gives nodes of its stack
+    to the task queue while some worker is idle. Returns a goal node, or None."""
+    tasks, pending, idle, found = shared
+    frontier = [node]
+    generated = {node.state}
+    expanded = 0
+
+    while frontier:
+        node = frontier.pop()
+
+        if problem.goal_test(node.state):
+            return node
+
+        for child in node.expand(problem):
+            if not transpositions:
+                frontier.append(child)
+            elif child.state not in generated:
+                generated.add(child.state)
+                frontier.append(child)
+
+        expanded += 1
+
+        if not (expanded % CHECK_EVERY):
+            if found.is_set():
+                return None
+
+            if idle.value and (len(frontier) > 1):
+                with pending.get_lock():
+                    pending.value += 1
+
+                tasks.put(frontier.pop(0))
+
+    return None
+
+
+def worker(problem, transpositions: bool, shared, results):
+    """Takes tasks from the queue until a goal is found or there are no tasks left.
+    An exception raised by the search is put in the results, and cancels every worker."""
+    tasks, pending, idle, found = shared
+
+    while not found.is_set():
+        with idle.get_lock():
+            idle.value += 1
+
+        try:
+            node = tasks.get(timeout=0.05)
+        except Empty:
+            node = None
+
+        with idle.get_lock():
+            idle.value -= 1
+
+        if node is None:
+            if not pending.value:
+                return
+
+            continue
+
+        try:
+            goal = subtree_search(problem, node, transpositions, shared)
+        except Exception as error:
+            goal = error
+        finally:
+            with pending.get_lock():
+                pending.value -= 1
+
+        if goal is not None:
+            results.put(goal)
+            found.set()
+            return
+
+
+def parallel_search(problem, processes = None, tasks_per_process = 4, transpositions = True):
+    """Searches for a goal with a pool of processes (one per CPU by default).
+    The top levels of the tree are split into about tasks_per_process tasks for each
+    process. Returns a goal node, or None if there is no goal. An exception raised
+    by a worker is raised again here, and so is a RuntimeError if a worker died
+    without an answer (so that it is not taken for the lack of a goal)."""
+    processes = processes or multiprocessing.cpu_count()
+    goal, nodes = split(problem, processes * tasks_per_process)
+
+    if (goal is not None) or not nodes:
+        return goal
+
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    shared = (tasks, multiprocessing.Value('i', len(nodes)), multiprocessing.Value('i', 0), multiprocessing.Event())
+
+    # The nodes at the end of the frontier are the ones a depth first search would try first.
+    for node in reversed(nodes):
+        tasks.put(node)
+
+    workers = [multiprocessing.Process(target=worker, args=(problem, transpositions, shared, results), daemon=True)
+               for _ in range(processes)]
+
+    for process in workers:
+        process.start()
+
+    try:
+        while True:
+            try:
+                result = results.get(timeout=0.05)
+                break
+            except Empty:
+                if not any(process.is_alive() for process in workers):
+                    # Every worker stopped: a goal may have been put just before the last one did.
+                    try:
+                        result = results.get(timeout=0.1)
+                        break
+                    except Empty:
+                        if any(process.exitcode for process in workers):
+                            raise RuntimeError('a worker of parallel_search died without an answer')
+
+                        return None
+
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+    finally:
+        shared[-1].set()
+
+        # Tasks nobody took are still in the feeder thread of this process, which would
+        # block the exit of the interpreter once they fill the pipe.
+        tasks.cancel_join_thread()
+        results.cancel_join_thread()
+
+        for process in workers:
+            process.terminate()
+            process.join()
+
+
+def call(function, index: int, results):
+    """Puts (index, function()) in the results queue, or (index, exception) if the
+    function raised one (runs in a process of race)."""
+    try:
+        result = function()
+    except Exception as error:
+        result = error
+
+    results.put((index, result))
+
+
+def race(functions: list):
+    """Calls each function (without arguments) in its own process, and returns
+    (index, result) for the first one to return a result other than None, or
+    (None, None) if none of them does. The other processes are terminated.
+    If no function returned a result, the first exception raised by one of them is
+    raised again, and so is a RuntimeError if a process died without an answer."""
+    results = multiprocessing.Queue()
+    racers = [multiprocessing.Process(target=call, args=(function, index, results), daemon=True)
+              for index, function in enumerate(functions)]
+
+    for process in racers:
+        process.start()
+
+    errors = []
+
+    try:
+        for _ in racers:
+            while True:
+                try:
+                    index, result = results.get(timeout=0.05)
+                    break
+                except Empty:
+                    # A process that died without a result (e.g. killed) never puts one.
+                    if not any(process.is_alive() for process in racers) and results.empty():
+                        raise RuntimeError('a process of race died without an answer')
+
+            if isinstance(result, Exception):
+                errors.append(result)
+            elif result is not None:
+                return index, result
+
+        if errors:
+            raise errors[0]
+
+        return None, None
+    finally:
+        for process in racers:
+            process.terminate()
+            process.join()
@@ -0,0 +1,407 @@
+# sat.py: SAT solver backend for Bimaru.
+#
+# A parsed board is encoded in CNF and solved by a small conflict-driven clause
+# learning (CDCL) solver, written in pure Python so that it runs without any
+# outside solver. Literals are DIMACS-style integers: v is the variable v and
+# -v its negation.
+
+from heapq import heappop, heappush
+
+
+def luby(i: int):
+    """Returns the i-th element (starting at 1) of the Luby sequence 1 1 2 1 1 2 4 1 ..."""
+    k = 1
+
+    while (1 << k) - 1 < i:
+        k += 1
+
+    while (1 << k) - 1 != i:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+
+        while (1 << k) - 1 < i:
+            k += 1
+
+    return 1 << (k - 1)
+
+
+class Solver:
+    """CDCL SAT solver with two watched literals, 1-UIP clause learning,
+    VSIDS branching, phase saving and Luby restarts."""
+
+    def __init__(self):
+        self.variables = 0
+        self.clauses = []
+        self.watches = {}       # literal -> indices of the clauses watching it
+        self.assigns = [0]      # 1 = true, -1 = false, 0 = unassigned
+        self.level = [0]
+        self.reason = [None]
+        self.activity = [0.0]
+        self.polarity = [False]
+        self.trail = []
+        self.limits = []        # trail size at the start of each decision level
+        self.qhead = 0
+        self.heap = []
+        self.increment = 1.0
+        self.conflicts = 0
+        self.unsat = False
+
+    def new_var(self):
+        """Creates a new variable and returns it."""
+        self.variables += 1
+        v = self.variables
+        self.assigns.append(0)
+        self.level.append(0)
+        self.reason.append(None)
+        self.activity.append(0.0)
+        self.polarity.append(False)
+        self.watches[v] = []
+        self.watches[-v] = []
+        heappush(self.heap, (0.0, v))
+        return v
+
+    def value(self, lit: int):
+        """Returns 1 if the literal is true, -1 if it is false and 0 if it is unassigned."""
+        return self.assigns[lit] if (lit > 0) else -self.assigns[-lit]
+
+    def add_clause(self, lits):
+        """Adds a clause (an iterable of literals) to the problem, before solving."""
+        clause = []
+
+        for lit in lits:
+            if -lit in clause:
+                return
+
+            if lit not in clause:
+                clause.append(lit)
+
+        clause = [lit for lit in clause if self.value(lit) != -1]
+
+        if any(self.value(lit) == 1 for lit in clause):
+            return
+
+        if not clause:
+            self.unsat = True
+        elif (len(clause) == 1):
+            self.enqueue(clause[0], None)
+            self.unsat = self.unsat or (self.propagate() is not None)
+        else:
+            self.attach(clause)
+
+    def attach(self, clause: list):
+        """Stores a clause, watching its first two literals. Returns its index."""
+        self.clauses.append(clause)
+        index = len(self.clauses) - 1
+        self.watches[clause[0]].append(index)
+        self.watches[clause[1]].append(index)
+        return index
+
+    def enqueue(self, lit: int, reason):
+        """Assigns the literal to true, at the current decision level."""
+        v = abs(lit)
+        self.assigns[v] = 1 if (lit > 0) else -1
+        self.level[v] = len(self.limits)
+        self.reason[v] = reason
+        self.trail.append(lit)
+
+    def propagate(self):
+        """Propagates every assignment in the trail. Returns the index of a
+        conflicting clause, or None if there is no conflict."""
+        while self.qhead < len(self.trail):
+            false = -self.trail[self.qhead]
+            self.qhead += 1
+            watching = self.watches[false]
+            self.watches[false] = kept = []
+
+            for position, index in enumerate(watching):
+                clause = self.clauses[index]
+
+                if (clause[0] == false):
+                    clause[0], clause[1] = clause[1], clause[0]
+
+                if (self.value(clause[0]) == 1):
+                    kept.append(index)
+                    continue
+
+                for k in range(2, len(clause)):
+                    if (self.value(clause[k]) != -1):
+                        clause[1], clause[k] = clause[k], clause[1]
+                        self.watches[clause[1]].append(index)
+                        break
+                else:
+                    kept.append(index)
+
+                    if (self.value(clause[0]) == -1):
+                        kept.extend(watching[position + 1:])
+                        self.qhead = len(self.trail)
+                        return index
+
+                    self.enqueue(clause[0], index)
+
+        return None
+
+    def bump(self, v: int):
+        """Increases the activity of a variable that took part in a conflict."""
+        self.activity[v] += self.increment
+
+        if (self.activity[v] > 1e100):
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.increment *= 1e-100
+            self.heap = [(-self.activity[u], u) for u in range(1, self.variables + 1) if not self.assigns[u]]
+            self.heap.sort()
+
+        if not self.assigns[v]:
+            heappush(self.heap, (-self.activity[v], v))
+
+    def analyze(self, conflict: int):
+        """Learns the first UIP clause of a conflict. Returns it (with the asserting
+        literal first) and the level to backjump to."""
+        seen = set()
+        learnt = [None]
+        counter = 0
+        lit = None
+        clause = self.clauses[conflict]
+        position = len(self.trail) - 1
+        current = len(self.limits)
+
+        while True:
+            for q in (clause if (lit is None) else clause[1:]):
+                v = abs(q)
+
+                if (v not in seen) and (self.level[v] > 0):
+                    seen.add(v)
+                    self.bump(v)
+
+                    if (self.level[v] == current):
+                        counter += 1
+                    else:
+                        learnt.append(q)
+
+            while abs(self.trail[position]) not in seen:
+                position -= 1
+
+            lit = self.trail[position]
+            position -= 1
+            seen.discard(abs(lit))
+            counter -= 1
+
+            if not counter:
+                break
+
+            clause = self.clauses[self.reason[abs(lit)]]
+
+        learnt[0] = -lit
+
+        if (len(learnt) == 1):
+            return learnt, 0
+
+        # The literal of the highest level (besides the asserting one) is watched too.
+        deepest = max(range(1, len(learnt)), key=lambda i: self.level[abs(learnt[i])])
+        learnt[1], learnt[deepest] = learnt[deepest], learnt[1]
+        return learnt, self.level[abs(learnt[1])]
+
+    def cancel(self, level: int):
+        """Undoes every assignment above the given decision level."""
+        if (len(self.limits) <= level):
+            return
+
+        for lit in self.trail[self.limits[level]:]:
+            v = abs(lit)
+            self.polarity[v] = lit > 0
+            self.assigns[v] = 0
+            self.reason[v] = None
+            heappush(self.heap, (-self.activity[v], v))
+
+        del self.trail[self.limits[level]:]
+        del self.limits[level:]
+        self.qhead = len(self.trail)
+
+    def decide(self):
+        """Returns the unassigned variable with the highest activity, or None."""
+        while self.heap:
+            _, v = heappop(self.heap)
+
+            if not self.assigns[v]:
+                return v
+
+        return None
+
+    def solve(self, restart_base = 100):
+        """Returns True if the problem is satisfiable (see model) and False otherwise."""
+        if self.unsat or (self.propagate() is not None):
+            return False
+
+        restarts = 1
+        budget = restart_base * luby(restarts)
+
+        while True:
+            conflict = self.propagate()
+
+            if (conflict is not None):
+                if not self.limits:
+                    return False
+
+                self.conflicts += 1
+                budget -= 1
+                learnt, level = self.analyze(conflict)
+                self.cancel(level)
+
+                if (len(learnt) == 1):
+                    self.enqueue(learnt[0], None)
+                else:
+                    self.enqueue(learnt[0], self.attach(learnt))
+
+                self.increment /= 0.95
+
+                if (budget <= 0):
+                    restarts += 1
+                    budget = restart_base * luby(restarts)
+                    self.cancel(0)
+
+                continue
+
+            v = self.decide()
+
+            if v is None:
+                return True
+
+            self.limits.append(len(self.trail))
+            self.enqueue(v if self.polarity[v] else -v, None)
+
+    def model(self):
+        """Returns the set of variables that are true (after solve returned True)."""
+        return {v for v in range(1, self.variables + 1) if (self.assigns[v] == 1)}
+
+
+class Encoder:
+    """Builds clauses over a Solver, with constants (True/False) allowed in place of literals."""
+
+    def __init__(self, solver: Solver):
+        self.solver = solver
+
+    def clause(self, *lits):
+        """Adds a clause; True literals satisfy it and False literals are dropped."""
+        if True in lits:
+            return
+
+        self.solver.add_clause(lit for lit in lits if (lit is not False))
+
+    def negate(self, lit):
+        return (not lit) if isinstance(lit, bool) else -lit
+
+    def exactly(self, lits: list, k: int):
+        """Constrains exactly k of the literals to be true (sequential counter).
+
+        count[j] stands for 'at least j of the literals seen so far are true'."""
+        if (k < 0) or (k > len(lits)):
+            self.clause()
+            return
+
+        count = [True] + [False] * (k + 1)
+
+        for lit in lits:
+            following = [True]
+
+            for j in range(1, k + 2):
+                if (count[j - 1] is False):
+                    following.append(False)
+                    continue
+
+                s = self.solver.new_var()
+                self.clause(self.negate(count[j]), s)
+                self.clause(self.negate(lit), self.negate(count[j - 1]), s)
+                self.clause(-s, count[j], lit)
+                self.clause(-s, count[j], count[j - 1])
+                following.append(s)
+
+            count = following
+
+        self.clause(count[k])
+        self.clause(self.negate(count[k + 1]))
+
+
+def solve(board):
+    """Solves the given board (see bimaru.Board) with the SAT solver.
+    Returns a solved clone of the board, or None if it has no solution."""
+    if board.is_goal():
+        return board
+
+    if not board.consistent:
+        return None
+
+    geometry = board.geometry
+    solver = Solver()
+    encoder = Encoder(solver)
+    empty = ~(board.ship | board.water)
+
+    # Cell variables: one for each empty cell, true if it is part of a boat.
+    cells = {}
+
+    for r, c in geometry.bits(empty & geometry.full_mask):
+        cells[r, c] = solver.new_var()
+
+        if (board.forced & geometry.bit(r, c)):
+            encoder.clause(cells[r, c])
+
+    # Placement variables, and piece-type variables for the hinted cells.
+    placements = {}
+    covering = {cell: [] for cell in cells}
+    types = {}
+    hinted = board.hinted()
+
+    for size in range(1, len(board.boats) + 1):
+        actions = board.generate_placements(size) if board.boats[-size] else []
+
+        for action in actions:
+            p = placements[action] = solver.new_var()
+            body, ring, pieces = geometry.boat_masks(action)
+
+            for r, c in geometry.bits(body):
+                encoder.clause(-p, cells[r, c])
+                covering[r, c].append(p)
+
+            for r, c in geometry.bits(ring & empty):
+                encoder.clause(-p, -cells[r, c])
+
+            for piece, mask in pieces:
+                for r, c in geometry.bits(mask & hinted):
+                    types.setdefault((r, c, piece), []).append(p)
+
+        encoder.exactly([placements[action] for action in actions], board.boats[-size])
+
+    # Every boat cell belongs to some placement.
+    for cell, ps in covering.items():
+        encoder.clause(-cells[cell], *ps)
+
+    # A hinted cell has the piece of its hint: t <-> one of the placements putting it there.
+    for hint, mask in board.hints.items():
+        if (hint == 'W'):
+            continue
+
+        for r, c in geometry.bits(mask & ~board.ship):
+            t = solver.new_var()
+            ps = types.get((r, c, hint.lower()), [])
+            encoder.clause(-t, *ps)
+
+            for p in ps:
+                encoder.clause(-p, t)
+
+            encoder.clause(t)
+
+    for values, masks in ((board.row_values, geometry.row_masks), (board.col_values, geometry.col_masks)):
+        for i, value in enumerate(values):
+            encoder.exactly([cells[cell] for cell in geometry.bits(masks[i] & empty)], value)
+
+    if not solver.solve():
+        return None
+
+    model = solver.model()
+    solved = board.__clone__()
+
+    for action, p in placements.items():
+        if p in model:
+            r, c, size = action[:3]
+            solved.take_boat(size)
+            solved.place_boat(r, c, size, (size > 1) and action[3])
+
+    return solved if solved.is_goal() else None
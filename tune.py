@@ -0,0 +1,117 @@
+# tune.py: Tunes the heuristic weights of bimaru.py (hhint, hcell and hboat).
+#
+# Each configuration of weights is scored by running the chosen searches (with the
+# weights heuristic, see heuristics.py) over the instance directories, and the
+# configurations are spread over a pool of workers. The best one is written to a
+# JSON profile, which bimaru.py loads when it is imported (see bimaru.load_profile);
+# to make them the default, copy them to the constants of bimaru.py instead.
+#
+#   $ python3 tune.py --method random --samples 50 --jobs 4 --objective nodes
+
+import itertools
+import json
+import os
+import random
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import StringIO
+from time import perf_counter
+
+import bimaru
+import heuristics
+from benchmark import instance_paths
+from search import InstrumentedProblem, astar_search, greedy_search
+
+SEARCHES = {search.__name__: search for search in (greedy_search, astar_search)}
+
+
+@lru_cache(maxsize=None)
+def read(path: str):
+    """Returns the contents of an instance file (read once by each worker)."""
+    with open(path) as file:
+        return file.read()
+
+
+def score(task: tuple):
+    """Runs the searches over the instances with the given weights.
+    Returns the weights, the total nodes expanded and the total time (in seconds)."""
+    weights, paths, searches = task
+    bimaru.hhint, bimaru.hcell, bimaru.hboat = weights
+    nodes = 0
+    start = perf_counter()
+
+    for path in paths:
+        for search in searches:
+            board = bimaru.Board.parse_instance(stream=StringIO(read(path)))
+            problem = InstrumentedProblem(bimaru.Bimaru(board, heuristic=heuristics.weights))
+            search(problem)
+            nodes += problem.succs
+
+    return weights, nodes, perf_counter() - start
+
+
+def configurations(method: str, values: list, samples: int, seed: int):
+    """Returns the weights (hhint, hcell, hboat) to try: every combination of the
+    given values (grid), or samples drawn uniformly from their range (random).
+    The current weights of bimaru.py are always tried first."""
+    current = (bimaru.hhint, bimaru.hcell, bimaru.hboat)
+
+    if (method == 'grid'):
+        candidates = list(itertools.product(values, repeat=3))
+    else:
+        rng = random.Random(seed)
+        low, high = min(values), max(values)
+        candidates = [tuple(round(rng.uniform(low, high), 2) for _ in range(3)) for _ in range(samples)]
+
+    return [current] + [weights for weights in candidates if (weights != current)]
+
+
+def main():
+    parser = ArgumentParser(description='Searches the heuristic weights of bimaru.py that expand the fewest '
+                                        'nodes (or take the least time) over the instance directories.')
+    parser.add_argument('--dirs', nargs='+', default=('easy', 'medium', 'hard'),
+                        help='directories of instances/ to run (default: %(default)s)')
+    parser.add_argument('--searches', nargs='+', choices=SEARCHES, default=list(SEARCHES),
+                        help='searches run with each configuration (default: %(default)s)')
+    parser.add_argument('--method', choices=('grid', 'random'), default='grid',
+                        help='try every combination of --values, or random weights in their range (default: %(default)s)')
+    parser.add_argument('--values', nargs='+', type=float, default=[0, 0.5, 1, 2, 4],
+                        help='values of each weight (default: %(default)s)')
+    parser.add_argument('--samples', type=int, default=50,
+                        help='configurations tried by the random method (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the random method (default: %(default)s)')
+    parser.add_argument('--objective', choices=('nodes', 'time'), default='nodes',
+                        help='total to minimize over the instances (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='number of configurations scored at the same time (default: %(default)s)')
+    parser.add_argument('--output', default=bimaru.PROFILE,
+                        help='profile to write the best weights to (default: %(default)s)')
+    args = parser.parse_args()
+
+    paths = [path for directory in args.dirs for path in instance_paths(directory)]
+    searches = [SEARCHES[name] for name in args.searches]
+    tasks = [(weights, paths, searches) for weights in
+             configurations(args.method, args.values, args.samples, args.seed)]
+    best = None
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for weights, nodes, time in executor.map(score, tasks):
+            value = nodes if (args.objective == 'nodes') else time
+            print('hhint=%g hcell=%g hboat=%g: %d nodes, %.2fs' % (weights + (nodes, time)))
+
+            if (best is None) or (value < best[0]):
+                best = (value, weights, nodes, time)
+
+    _, (hhint, hcell, hboat), nodes, time = best
+    print('best: hhint=%g hcell=%g hboat=%g (%d nodes, %.2fs)' % (hhint, hcell, hboat, nodes, time))
+
+    with open(args.output, 'w') as file:
+        json.dump({'hhint': hhint, 'hcell': hcell, 'hboat': hboat, 'objective': args.objective,
+                   'searches': args.searches, 'dirs': list(args.dirs), 'nodes': nodes, 'time': time}, file, indent=1)
+        file.write('\n')
+
+
+if __name__ == "__main__":
+    main()
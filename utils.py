@@ -3,8 +3,6 @@
 import bisect
 import collections
 import collections.abc
-import functools
-import heapq
 import operator
 import os.path
 import random
@@ -13,6 +11,9 @@ from statistics import mean
 
 import numpy as np
 
+# Kept in utils_core, so that the search core can use them without importing numpy.
+from utils_core import IndexedPriorityQueue, PriorityQueue, is_in, memoize
+
 
 # ______________________________________________________________________________
 # Functions on Sequences and Iterables
@@ -73,11 +74,6 @@ def first(iterable, default=None):
     return next(iter(iterable), default)
 
 
-def is_in(elt, seq):
-    """Similar to (elt in seq), but compares with 'is', not '=='."""
-    return any(x is elt for x in seq)
-
-
 def mode(data):
     """Return the most common data item. If there are ties, return any one of them."""
     [(item, count)] = collections.Counter(data).most_common(1)
@@ -405,26 +401,6 @@ class injection:
         globals().update(self.old)
 
 
-def memoize(fn, slot=None, maxsize=32):
-    """Memoize fn: make it remember the computed value for any argument list.
-    If slot is specified, store result in that slot of first argument.
-    If slot is false, use lru_cache for caching the values."""
-    if slot:
-        def memoized_fn(obj, *args):
-            if hasattr(obj, slot):
-                return getattr(obj, slot)
-            else:
-                val = fn(obj, *args)
-                setattr(obj, slot, val)
-                return val
-    else:
-        @functools.lru_cache(maxsize=maxsize)
-        def memoized_fn(*args):
-            return fn(*args)
-
-    return memoized_fn
-
-
 def name(obj):
     """Try to find some reasonable name for the object."""
     return (getattr(obj, 'name', 0) or getattr(obj, '__name__', 0) or
@@ -719,64 +695,6 @@ class hashabledict(dict):
 # PriorityQueue is implemented here
 
 
-class PriorityQueue:
-    """A Queue in which the minimum (or maximum) element (as determined by f and
-    order) is returned first.
-    If order is 'min', the item with minimum f(x) is
-    returned first; if order is 'max', then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
-
-    def __init__(self, order='min', f=lambda x: x):
-        self.heap = []
-        if order == 'min':
-            self.f = f
-        elif order == 'max':  # now item with max f(x)
-            self.f = lambda x: -f(x)  # will be popped first
-        else:
-            raise ValueError("Order must be either 'min' or 'max'.")
-
-    def append(self, item):
-        """Insert item at its correct position."""
-        heapq.heappush(self.heap, (self.f(item), item))
-
-    def extend(self, items):
-        """Insert each item in items at its correct position."""
-        for item in items:
-            self.append(item)
-
-    def pop(self):
-        """Pop and return the item (with min or max f(x) value)
-        depending on the order."""
-        if self.heap:
-            return heapq.heappop(self.heap)[1]
-        else:
-            raise Exception('Trying to pop from empty PriorityQueue.')
-
-    def __len__(self):
-        """Return current capacity of PriorityQueue."""
-        return len(self.heap)
-
-    def __contains__(self, key):
-        """Return True if the key is in PriorityQueue."""
-        return any([item == key for _, item in self.heap])
-
-    def __getitem__(self, key):
-        """Returns the first value associated with key in PriorityQueue.
-        Raises KeyError if key is not present."""
-        for value, item in self.heap:
-            if item == key:
-                return value
-        raise KeyError(str(key) + " is not in the priority queue")
-
-    def __delitem__(self, key):
-        """Delete the first occurrence of key."""
-        try:
-            del self.heap[[item == key for _, item in self.heap].index(True)]
-        except ValueError:
-            raise KeyError(str(key) + " is not in the priority queue")
-        heapq.heapify(self.heap)
-
-
 # ______________________________________________________________________________
 # Useful Shorthands
 
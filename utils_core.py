@@ -0,0 +1,143 @@
+"""Utilities needed by the search core (search.py), kept apart from utils.py
+so that they can be imported without numpy and the rest of the utilities."""
+
+import functools
+import heapq
+
+
+def is_in(elt, seq):
+    """Similar to (elt in seq), but compares with 'is', not '=='."""
+    return any(x is elt for x in seq)
+
+
+def memoize(fn, slot=None, maxsize=32):
+    """Memoize fn: make it remember the computed value for any argument list.
+    If slot is specified, store result in that slot of first argument.
+    If slot is false, use lru_cache for caching the values."""
+    if slot:
+        def memoized_fn(obj, *args):
+            if hasattr(obj, slot):
+                return getattr(obj, slot)
+            else:
+                val = fn(obj, *args)
+                setattr(obj, slot, val)
+                return val
+    else:
+        @functools.lru_cache(maxsize=maxsize)
+        def memoized_fn(*args):
+            return fn(*args)
+
+    return memoized_fn
+
+
+class PriorityQueue:
+    """A Queue in which the minimum (or maximum) element (as determined by f and
+    order) is returned first.
+    If order is 'min', the item with minimum f(x) is
+    returned first; if order is 'max', then it is the item with maximum f(x).
+    Also supports dict-like lookup."""
+
+    def __init__(self, order='min', f=lambda x: x):
+        self.heap = []
+        if order == 'min':
+            self.f = f
+        elif order == 'max':  # now item with max f(x)
+            self.f = lambda x: -f(x)  # will be popped first
+        else:
+            raise ValueError("Order must be either 'min' or 'max'.")
+
+    def append(self, item):
+        """Insert item at its correct position."""
+        heapq.heappush(self.heap, (self.f(item), item))
+
+    def extend(self, items):
+        """Insert each item in items at its correct position."""
+        for item in items:
+            self.append(item)
+
+    def pop(self):
+        """Pop and return the item (with min or max f(x) value)
+        depending on the order."""
+        if self.heap:
+            return heapq.heappop(self.heap)[1]
+        else:
+            raise Exception('Trying to pop from empty PriorityQueue.')
+
+    def __len__(self):
+        """Return current capacity of PriorityQueue."""
+        return len(self.heap)
+
+    def __contains__(self, key):
+        """Return True if the key is in PriorityQueue."""
+        return any([item == key for _, item in self.heap])
+
+    def __getitem__(self, key):
+        """Returns the first value associated with key in PriorityQueue.
+        Raises KeyError if key is not present."""
+        for value, item in self.heap:
+            if item == key:
+                return value
+        raise KeyError(str(key) + " is not in the priority queue")
+
+    def __delitem__(self, key):
+        """Delete the first occurrence of key."""
+        try:
+            del self.heap[[item == key for _, item in self.heap].index(True)]
+        except ValueError:
+            raise KeyError(str(key) + " is not in the priority queue")
+        heapq.heapify(self.heap)
+
+
+class IndexedPriorityQueue(PriorityQueue):
+    """A PriorityQueue that also keeps a dict from each item to its entry in the
+    heap, so that membership, lookup and deletion take constant time instead of a
+    scan of the heap. Deleted entries are only marked as dead, and are dropped when
+    they reach the top of the heap. Items must be hashable; appending an item that
+    is already in the queue replaces its entry."""
+
+    def __init__(self, order='min', f=lambda x: x):
+        super().__init__(order, f)
+        self.entries = {}
+
+    def append(self, item):
+        """Insert item at its correct position."""
+        if item in self.entries:
+            del self[item]
+        entry = [self.f(item), item, True]  # [value, item, alive]
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
+
+    def pop(self):
+        """Pop and return the item (with min or max f(x) value)
+        depending on the order."""
+        while self.heap:
+            _, item, alive = heapq.heappop(self.heap)
+            if alive:
+                del self.entries[item]
+                return item
+        raise Exception('Trying to pop from empty PriorityQueue.')
+
+    def __len__(self):
+        """Return current capacity of PriorityQueue."""
+        return len(self.entries)
+
+    def __contains__(self, key):
+        """Return True if the key is in PriorityQueue."""
+        return key in self.entries
+
+    def __getitem__(self, key):
+        """Returns the value associated with key in PriorityQueue.
+        Raises KeyError if key is not present."""
+        if key not in self.entries:
+            raise KeyError(str(key) + " is not in the priority queue")
+        return self.entries[key][0]
+
+    def __delitem__(self, key):
+        """Delete key (its heap entry is marked as dead)."""
+        if key not in self.entries:
+            raise KeyError(str(key) + " is not in the priority queue")
+        self.entries.pop(key)[2] = False
+        # Rebuild the heap when most of it is dead entries.
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [entry for entry in self.heap if entry[2]]
+            heapq.heapify(self.heap)